@@ -6,7 +6,7 @@ import re
 import json
 from typing import Dict, List, Tuple, Optional
 from pathlib import Path
-from reference_matching import ReferenceFeatureExtractor
+from reference_matching import ReferenceFeatureExtractor, PreppedEntry
 
 
 class AutoLabeler:
@@ -55,13 +55,16 @@ class AutoLabeler:
         
         return None
     
-    def find_best_match(self, bib_entry, ref_entries_dict: Dict[str, Dict]) -> Optional[Tuple[str, float, str]]:
+    def find_best_match(self, bib_entry, ref_entries_dict: Dict[str, Dict],
+                        prepped_refs: Optional[Dict[str, PreppedEntry]] = None) -> Optional[Tuple[str, float, str]]:
         """
         Find best matching reference for a BibTeX entry
         
         Args:
             bib_entry: BibTeX entry (BibEntry object or dict)
             ref_entries_dict: Dictionary of arxiv_id -> reference entry
+            prepped_refs: Optional arxiv_id -> prepared reference, so callers
+                          matching many entries prepare each reference once
             
         Returns:
             (arxiv_id, confidence_score, method) if match found, None otherwise
@@ -77,29 +80,20 @@ class AutoLabeler:
         best_score = 0.0
         best_method = None
         
-        bib_title = bib_entry.fields.get('title', '')
-        bib_authors = bib_entry.fields.get('author', '')
+        extractor = self.feature_extractor
+        if prepped_refs is None:
+            prepped_refs = self.prepare_refs(ref_entries_dict)
         
-        if isinstance(bib_authors, str):
-            bib_authors = [a.strip() for a in bib_authors.split(' and ')]
+        # Tokens, normalized title and author sets are computed once per entry
+        bib = extractor.prepare_bib_entry(bib_entry)
         
-        for arxiv_id, ref_entry in ref_entries_dict.items():
-            ref_title = ref_entry.get('title', '')
-            ref_authors = ref_entry.get('authors', [])
-            
-            if isinstance(ref_authors, str):
-                ref_authors = [a.strip() for a in ref_authors.split(',')]
-            
+        for arxiv_id, ref in prepped_refs.items():
             # Compute title similarity
-            if bib_title and ref_title:
-                bib_tokens = self.feature_extractor.tokenize(bib_title)
-                ref_tokens = self.feature_extractor.tokenize(ref_title)
-                title_sim = self.feature_extractor.token_overlap_ratio(bib_tokens, ref_tokens)
+            if bib.title and ref.title:
+                title_sim = extractor.jaccard_similarity(bib.title_tokens, ref.title_tokens)
                 
                 # Also check Levenshtein
-                norm_bib_title = self.feature_extractor.normalize_string(bib_title)
-                norm_ref_title = self.feature_extractor.normalize_string(ref_title)
-                lev_sim = self.feature_extractor.normalized_levenshtein(norm_bib_title, norm_ref_title)
+                lev_sim = extractor.normalized_levenshtein(bib.title_norm, ref.title_norm)
                 
                 # Take max of two similarity measures
                 title_score = max(title_sim, lev_sim)
@@ -107,7 +101,7 @@ class AutoLabeler:
                 title_score = 0.0
             
             # Compute author similarity
-            author_score = self.feature_extractor.author_similarity(bib_authors, ref_authors)
+            author_score = extractor.prepped_author_similarity(bib, ref)
             
             # Combined score (weighted)
             combined_score = 0.7 * title_score + 0.3 * author_score
@@ -128,6 +122,19 @@ class AutoLabeler:
         
         return None
     
+    def prepare_refs(self, ref_entries_dict: Dict[str, Dict]) -> Dict[str, PreppedEntry]:
+        """
+        Prepare every reference of a publication for find_best_match
+        
+        Args:
+            ref_entries_dict: Dictionary of arxiv_id -> reference entry
+            
+        Returns:
+            Dictionary of arxiv_id -> PreppedEntry
+        """
+        return {arxiv_id: self.feature_extractor.prepare_ref_entry(ref_entry, arxiv_id)
+                for arxiv_id, ref_entry in ref_entries_dict.items()}
+    
     def generate_labels_for_publication(self, pub_id: str, bib_entries: List[Dict], 
                                        ref_entries_dict: Dict[str, Dict]) -> Dict:
         """
@@ -156,12 +163,14 @@ class AutoLabeler:
             }
         }
         
+        prepped_refs = self.prepare_refs(ref_entries_dict)
+        
         for bib_entry in bib_entries:
             bib_key = bib_entry.cite_key
             if not bib_key:
                 continue
             
-            match_result = self.find_best_match(bib_entry, ref_entries_dict)
+            match_result = self.find_best_match(bib_entry, ref_entries_dict, prepped_refs)
             
             if match_result:
                 arxiv_id, confidence, method = match_result
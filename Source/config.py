@@ -40,6 +40,10 @@ FIGURE_ENVS = ['figure', 'figure*', 'table', 'table*']
 # List environments
 LIST_ENVS = ['itemize', 'enumerate', 'description']
 
+# Content hashing for deduplication: 'blake2b' (faster) or 'sha256'
+# (reproduces content_hash values written by earlier versions)
+CONTENT_HASH_ALGORITHM = 'blake2b'
+
 # Machine Learning settings
 ML_TRAIN_TEST_SPLIT = 0.2  # 20% for test
 ML_VALIDATION_SPLIT = 0.1  # 10% for validation
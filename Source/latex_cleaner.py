@@ -45,6 +45,9 @@ class LaTeXCleaner:
         r'\[p\]',
     ]
     
+    # All of the above as one alternation, so removal is a single pass
+    STRIP_PATTERN = re.compile('|'.join(FORMATTING_COMMANDS + TABLE_COMMANDS))
+    
     def __init__(self):
         """Initialize cleaner"""
         pass
@@ -59,12 +62,7 @@ class LaTeXCleaner:
         Returns:
             Cleaned content
         """
-        cleaned = content
-        
-        for cmd in self.FORMATTING_COMMANDS + self.TABLE_COMMANDS:
-            cleaned = re.sub(cmd, '', cleaned)
-        
-        return cleaned
+        return self.STRIP_PATTERN.sub('', content)
     
     def normalize_inline_math(self, content: str) -> str:
         """
@@ -77,8 +75,7 @@ class LaTeXCleaner:
             Content with normalized inline math
         """
         # Convert \( ... \) to $ ... $
-        content = re.sub(r'\\\(', '$', content)
-        content = re.sub(r'\\\)', '$', content)
+        content = content.replace('\\(', '$').replace('\\)', '$')
         
         return content
     
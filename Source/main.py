@@ -5,13 +5,14 @@ Process publications, create labels, and train ML model
 Usage:
     python main.py                # Interactive menu
     python main.py --process      # Process all publications
+    python main.py --process --force  # Reprocess even if up to date
     python main.py --auto-label   # Run auto-labeling
     python main.py --train        # Train ML model
     python main.py --full         # Run complete pipeline
     python main.py --status       # Show pipeline status
 """
+import os
 import re
-import json
 import shutil
 from pathlib import Path
 from typing import Dict, List
@@ -25,6 +26,49 @@ from hierarchy_builder import build_hierarchy_from_versions
 from bibtex_processor import process_publication_references, write_refs_bib
 from reference_matching import ReferenceMatchingModel, compute_mrr
 
+_PUB_ID_RE = re.compile(r'\d{4}-\d{5}')
+_VERSION_RE = re.compile(r'v(\d+)')
+
+
+def _fast_copy(src: Path, dst: Path):
+    """
+    Copy a read-only input file, hardlinking when possible
+    
+    Args:
+        src: Source file path
+        dst: Destination file path
+    """
+    if dst.exists():
+        dst.unlink()
+    
+    try:
+        # Hardlink is a pure inode operation - no content copy
+        os.link(src, dst)
+    except OSError:
+        # Cross-device link or filesystem without hardlink support
+        shutil.copy2(src, dst)
+
+
+def _is_stale(src: Path, dst: Path) -> bool:
+    """
+    Check whether a copied file is missing or differs from its source
+    
+    Args:
+        src: Source file path
+        dst: Destination file path
+        
+    Returns:
+        True if dst needs to be (re)copied
+    """
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        return True
+    
+    # Hardlinks share the stat; copy2 preserves mtime, so both compare equal
+    src_stat = src.stat()
+    return src_stat.st_size != dst_stat.st_size or src_stat.st_mtime != dst_stat.st_mtime
+
 
 class Pipeline:
     """Main processing pipeline"""
@@ -45,18 +89,21 @@ class Pipeline:
         """Get list of all publication IDs in sample directory"""
         pub_ids = []
         
-        for pub_dir in self.sample_dir.iterdir():
-            if pub_dir.is_dir() and re.match(r'\d{4}-\d{5}', pub_dir.name):
-                pub_ids.append(pub_dir.name)
+        # DirEntry.is_dir uses the cached d_type, avoiding a stat per entry
+        with os.scandir(self.sample_dir) as it:
+            for entry in it:
+                if entry.is_dir() and _PUB_ID_RE.match(entry.name):
+                    pub_ids.append(entry.name)
         
         return sorted(pub_ids)
     
-    def process_publication(self, pub_id: str) -> bool:
+    def process_publication(self, pub_id: str, force: bool = False) -> bool:
         """
         Process a single publication
         
         Args:
             pub_id: Publication ID (e.g., '2310-15395')
+            force: Reprocess even if output is up to date
             
         Returns:
             True if successful
@@ -70,28 +117,36 @@ class Pipeline:
             for filename in ['metadata.json', 'references.json']:
                 src = pub_dir / filename
                 dst = output_pub_dir / filename
-                if src.exists():
-                    shutil.copy2(src, dst)
+                if src.exists() and (force or _is_stale(src, dst)):
+                    _fast_copy(src, dst)
             
             # 2. Process all versions
             tex_dir = pub_dir / 'tex'
             if not tex_dir.exists():
                 return False
             
+            # Skip if hierarchy.json is newer than every input file
+            out_hier = output_pub_dir / 'hierarchy.json'
+            if not force and out_hier.exists():
+                newest_input = max(
+                    (p.stat().st_mtime for p in tex_dir.rglob('*') if p.is_file()),
+                    default=0
+                )
+                if out_hier.stat().st_mtime >= newest_input:
+                    return True
+            
+            # Single scandir pass: (version, path) for each version directory
+            with os.scandir(tex_dir) as it:
+                version_dirs = [
+                    (m.group(1), entry.path)
+                    for entry in it
+                    if entry.is_dir() and (m := _VERSION_RE.search(entry.name))
+                ]
+            
             versions_data = {}
-            for version_dir in tex_dir.iterdir():
-                if not version_dir.is_dir():
-                    continue
-                
-                version_name = version_dir.name
-                version_match = re.search(r'v(\d+)', version_name)
-                if version_match:
-                    version = version_match.group(1)
-                else:
-                    continue
-                
+            for version, version_path in version_dirs:
                 # Parse LaTeX
-                parsed_data = parse_version_directory(version_dir)
+                parsed_data = parse_version_directory(Path(version_path))
                 
                 if parsed_data['body']:
                     # Clean content
@@ -117,16 +172,16 @@ class Pipeline:
         except Exception as e:
             return False
     
-    def run(self, pub_id: str = None):
+    def run(self, pub_id: str = None, force: bool = False):
         """Run the data processing pipeline"""
         if pub_id:
             print(f"\nProcessing: {pub_id}")
-            success = self.process_publication(pub_id)
+            success = self.process_publication(pub_id, force=force)
             print(f"{'[OK]' if success else '[FAILED]'}")
         else:
-            self.process_all_publications()
+            self.process_all_publications(force=force)
     
-    def process_all_publications(self):
+    def process_all_publications(self, force: bool = False):
         """Process all publications in sample directory"""
         pub_ids = self.get_publication_ids()
         
@@ -140,7 +195,7 @@ class Pipeline:
         failed = 0
         
         for pub_id in tqdm(pub_ids, desc="Processing"):
-            if self.process_publication(pub_id):
+            if self.process_publication(pub_id, force=force):
                 successful += 1
             else:
                 failed += 1
@@ -155,10 +210,12 @@ class Pipeline:
         
         # Get publications with data
         pub_dirs = []
-        for pub_dir in self.output_dir.iterdir():
-            if pub_dir.is_dir():
-                if (pub_dir / 'refs.bib').exists() and (pub_dir / 'references.json').exists():
-                    pub_dirs.append(pub_dir)
+        with os.scandir(self.output_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    pub_dir = Path(entry.path)
+                    if (pub_dir / 'refs.bib').exists() and (pub_dir / 'references.json').exists():
+                        pub_dirs.append(pub_dir)
         
         if not pub_dirs:
             print("[ERROR] No publications with refs.bib and references.json found")
@@ -271,8 +328,9 @@ class Pipeline:
             # Show MRR
             by_partition = {'train': [], 'valid': [], 'test': []}
             for pred_file in pred_files:
-                with open(pred_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = load_json_safe(pred_file)
+                if not data:
+                    continue
                 partition = data.get('partition', 'unknown')
                 if partition in by_partition:
                     mrr = compute_mrr(data['prediction'], data['groundtruth'])
@@ -326,7 +384,13 @@ class Pipeline:
                     self.run_auto_labeling()
                 elif choice == '3':
                     import subprocess
-                    subprocess.run(['python', 'manual_labeling_helper.py'])
+                    import sys
+                    # Ctrl-C in the helper returns to the menu instead of exiting
+                    try:
+                        subprocess.run([sys.executable, 'manual_labeling_helper.py'],
+                                       cwd=Path(__file__).parent)
+                    except KeyboardInterrupt:
+                        print("\n\nLabeling interrupted, back to menu")
                 elif choice == '4':
                     self.run_ml_pipeline()
                 elif choice == '5':
@@ -355,6 +419,7 @@ def main():
     parser.add_argument('--train', action='store_true', help='Train ML model')
     parser.add_argument('--full', action='store_true', help='Full pipeline')
     parser.add_argument('--status', action='store_true', help='Show status')
+    parser.add_argument('--force', action='store_true', help='Reprocess up-to-date publications')
     
     args = parser.parse_args()
     
@@ -366,7 +431,7 @@ def main():
     if args.status:
         pipeline.show_status()
     elif args.process or args.pub_id:
-        pipeline.run(pub_id=args.pub_id)
+        pipeline.run(pub_id=args.pub_id, force=args.force)
     elif args.auto_label:
         pipeline.run_auto_labeling(args.num_auto)
     elif args.train:
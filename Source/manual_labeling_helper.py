@@ -2,22 +2,36 @@
 Manual Labeling Helper
 Interactive tool to help with manual labeling of references
 """
-import json
+import os
+import heapq
+import itertools
+import numpy as np
 from pathlib import Path
 from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
 from fuzzywuzzy import fuzz
 from config import OUTPUT_DIR
-from utils import load_json_safe
+from utils import load_json_safe, write_json_safe
 
 
 class ManualLabelingHelper:
     """Helper tool for manual reference labeling"""
     
+    # Number of TF-IDF candidates passed on to fuzzy scoring
+    TFIDF_CANDIDATES = 20
+    
     def __init__(self, output_dir: Path):
         self.output_dir = Path(output_dir)
         self.labels = {}
         self.labels_file = Path('manual_labels.json')
         
+        # Index of the currently loaded publication
+        self._references = None
+        self._ref_ids = []
+        self._ref_author_sets = []
+        self._tfidf = None
+        self._ref_mat_t = None
+        
         # Load existing labels if available
         if self.labels_file.exists():
             self.labels = load_json_safe(self.labels_file)
@@ -27,9 +41,10 @@ class ManualLabelingHelper:
     def get_publication_list(self) -> List[str]:
         """Get list of processed publications"""
         pubs = []
-        for pub_dir in self.output_dir.iterdir():
-            if pub_dir.is_dir() and (pub_dir / 'refs.bib').exists():
-                pubs.append(pub_dir.name)
+        with os.scandir(self.output_dir) as it:
+            for entry in it:
+                if entry.is_dir() and os.path.exists(os.path.join(entry.path, 'refs.bib')):
+                    pubs.append(entry.name)
         return sorted(pubs)
     
     def load_publication_data(self, pub_id: str) -> Dict:
@@ -55,11 +70,53 @@ class ManualLabelingHelper:
                     'fields': entry.fields
                 }
         
+        self._index_references(bib_entries, references)
+        
         return {
             'references': references,
             'bib_entries': bib_entries
         }
     
+    @staticmethod
+    def _author_token_set(ref_data: Dict) -> frozenset:
+        """Lowercased author name tokens longer than 3 characters"""
+        authors = ' '.join(ref_data.get('authors', [])).lower()
+        return frozenset(tok for tok in authors.split() if len(tok) > 3)
+    
+    def _index_references(self, bib_entries: Dict, references: Dict):
+        """
+        Precompute per-reference author token sets and a TF-IDF title index
+        used to pre-filter suggestion candidates
+        
+        Args:
+            bib_entries: BibTeX entries dict
+            references: References dict
+        """
+        self._references = references
+        self._ref_ids = list(references.keys())
+        self._ref_author_sets = [self._author_token_set(references[aid]) for aid in self._ref_ids]
+        self._tfidf = None
+        self._ref_mat_t = None
+        
+        try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+        except ImportError:
+            return
+        
+        ref_titles = [references[aid].get('title', '').lower() for aid in self._ref_ids]
+        bib_titles = [e['fields'].get('title', '').lower() for e in bib_entries.values()]
+        all_titles = [t for t in bib_titles + ref_titles if t]
+        
+        try:
+            self._tfidf = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5)).fit(all_titles)
+        except ValueError:
+            # Empty vocabulary (no usable titles)
+            return
+        
+        # Rows are L2-normalized, so a dot product is the cosine similarity.
+        # Store transposed once so each query is a single sparse matmul.
+        self._ref_mat_t = self._tfidf.transform(ref_titles).T.tocsr()
+    
     def suggest_matches(self, bib_entry: Dict, references: Dict, top_n: int = 5) -> List[tuple]:
         """
         Suggest potential matches for a BibTeX entry
@@ -72,17 +129,35 @@ class ManualLabelingHelper:
         Returns:
             List of (arxiv_id, score, reason) tuples
         """
-        suggestions = []
+        heap = []  # min-heap of (score, arxiv_id, reason), at most top_n items
         
         bib_title = bib_entry.get('fields', {}).get('title', '').lower()
         bib_year = bib_entry.get('fields', {}).get('year', '')
         bib_eprint = bib_entry.get('fields', {}).get('eprint', '')
+        bib_author = bib_entry.get('fields', {}).get('author', '').lower()
+        bib_author_parts = [p for p in bib_author.split() if len(p) > 3]
         
         # Check if arXiv ID directly in entry
         if bib_eprint and bib_eprint in references:
             return [(bib_eprint, 100, 'Direct arXiv ID match')]
         
-        for arxiv_id, ref_data in references.items():
+        ref_ids = list(references.keys())
+        if references is self._references:
+            ref_author_sets = self._ref_author_sets
+        else:
+            ref_author_sets = [self._author_token_set(references[aid]) for aid in ref_ids]
+        candidate_idx = range(len(ref_ids))
+        
+        # Only run fuzzy scoring on the closest titles by TF-IDF cosine
+        if (bib_title and self._ref_mat_t is not None and references is self._references
+                and len(ref_ids) > self.TFIDF_CANDIDATES):
+            q = self._tfidf.transform([bib_title])
+            cos = (q @ self._ref_mat_t).toarray()[0]
+            candidate_idx = np.argpartition(-cos, self.TFIDF_CANDIDATES)[:self.TFIDF_CANDIDATES]
+        
+        for idx in candidate_idx:
+            arxiv_id = ref_ids[idx]
+            ref_data = references[arxiv_id]
             ref_title = ref_data.get('title', '').lower()
             ref_year = ref_data.get('submitted_date', '')[:4]
             
@@ -102,25 +177,25 @@ class ManualLabelingHelper:
                 reasons.append(f'Year match: {bib_year}')
             
             # Author match (simple check)
-            bib_author = bib_entry.get('fields', {}).get('author', '').lower()
-            ref_authors = ' '.join(ref_data.get('authors', [])).lower()
+            ref_authors = ref_author_sets[idx]
             
-            if bib_author and ref_authors:
+            if bib_author_parts and ref_authors:
                 # Check for last name in authors
-                author_parts = bib_author.split()
-                for part in author_parts:
-                    if len(part) > 3 and part in ref_authors:
+                for part in bib_author_parts:
+                    if part in ref_authors:
                         score += 10
                         reasons.append(f'Author match: {part}')
                         break
             
             if score > 30:  # Minimum threshold
-                suggestions.append((arxiv_id, score, ', '.join(reasons)))
+                item = (score, arxiv_id, ', '.join(reasons))
+                if len(heap) < top_n:
+                    heapq.heappush(heap, item)
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, item)
         
         # Sort by score descending
-        suggestions.sort(key=lambda x: x[1], reverse=True)
-        
-        return suggestions[:top_n]
+        return [(arxiv_id, score, reason) for score, arxiv_id, reason in sorted(heap, reverse=True)]
     
     def interactive_label(self, pub_id: str):
         """Interactive labeling for one publication"""
@@ -138,62 +213,82 @@ class ManualLabelingHelper:
         print(f"\nFound {len(bib_entries)} BibTeX entries")
         print(f"Found {len(references)} reference candidates\n")
         
-        for i, (bib_key, bib_entry) in enumerate(bib_entries.items(), 1):
-            # Skip if already labeled
-            if bib_key in self.labels[pub_id]:
-                print(f"[{i}/{len(bib_entries)}] {bib_key} - Already labeled")
-                continue
-            
-            print(f"\n{'-'*70}")
-            print(f"[{i}/{len(bib_entries)}] BibTeX Key: {bib_key}")
-            print(f"Type: {bib_entry['type']}")
-            
-            if 'title' in bib_entry['fields']:
-                print(f"Title: {bib_entry['fields']['title'][:80]}...")
-            if 'author' in bib_entry['fields']:
-                print(f"Author: {bib_entry['fields']['author'][:80]}...")
-            if 'year' in bib_entry['fields']:
-                print(f"Year: {bib_entry['fields']['year']}")
-            
-            # Get suggestions
-            suggestions = self.suggest_matches(bib_entry, references)
-            
-            if suggestions:
-                print(f"\n📋 Suggested matches:")
-                for j, (arxiv_id, score, reason) in enumerate(suggestions, 1):
-                    ref = references[arxiv_id]
-                    print(f"\n  {j}. {arxiv_id} (Score: {score:.0f})")
-                    print(f"     Title: {ref.get('title', 'N/A')[:70]}...")
-                    print(f"     Authors: {', '.join(ref.get('authors', []))[:70]}...")
-                    print(f"     Year: {ref.get('submitted_date', 'N/A')[:4]}")
-                    print(f"     Reason: {reason}")
-            
-            print(f"\n{'='*70}")
-            response = input("Enter choice (1-5 for suggestion, arXiv ID, 's' to skip, 'q' to quit): ").strip()
-            
-            if response.lower() == 'q':
-                break
-            elif response.lower() == 's':
-                continue
-            elif response.isdigit() and 1 <= int(response) <= len(suggestions):
-                # Use suggestion
-                arxiv_id = suggestions[int(response) - 1][0]
-                self.labels[pub_id][bib_key] = arxiv_id
-                print(f"[OK] Labeled: {bib_key} = {arxiv_id}")
-            elif response in references:
-                # Direct arXiv ID input
-                self.labels[pub_id][bib_key] = response
-                print(f"[OK] Labeled: {bib_key} = {response}")
-            else:
-                print("[ERROR] Invalid input, skipping...")
+        entries = list(bib_entries.items())
+        pending = {}  # (pub_id, bib_key) -> Future of prefetched suggestions
+        
+        # Computes the next entry's suggestions while the user is typing; one
+        # pool per publication, so no prefetch outlives this reference index
+        prefetch = ThreadPoolExecutor(max_workers=1)
+        try:
+            for i, (bib_key, bib_entry) in enumerate(entries, 1):
+                # Skip if already labeled
+                if bib_key in self.labels[pub_id]:
+                    print(f"[{i}/{len(bib_entries)}] {bib_key} - Already labeled")
+                    continue
+                
+                print(f"\n{'-'*70}")
+                print(f"[{i}/{len(bib_entries)}] BibTeX Key: {bib_key}")
+                print(f"Type: {bib_entry['type']}")
+                
+                if 'title' in bib_entry['fields']:
+                    print(f"Title: {bib_entry['fields']['title'][:80]}...")
+                if 'author' in bib_entry['fields']:
+                    print(f"Author: {bib_entry['fields']['author'][:80]}...")
+                if 'year' in bib_entry['fields']:
+                    print(f"Year: {bib_entry['fields']['year']}")
+                
+                # Get suggestions (usually already computed during the previous prompt)
+                future = pending.pop((pub_id, bib_key), None)
+                if future is None:
+                    future = prefetch.submit(self.suggest_matches, bib_entry, references)
+                suggestions = future.result()
+                
+                # Start on the next unlabeled entry before blocking on input()
+                for next_key, next_entry in itertools.islice(entries, i, None):
+                    if next_key not in self.labels[pub_id]:
+                        pending[(pub_id, next_key)] = prefetch.submit(self.suggest_matches, next_entry, references)
+                        break
+                
+                if suggestions:
+                    print(f"\n📋 Suggested matches:")
+                    for j, (arxiv_id, score, reason) in enumerate(suggestions, 1):
+                        ref = references[arxiv_id]
+                        print(f"\n  {j}. {arxiv_id} (Score: {score:.0f})")
+                        print(f"     Title: {ref.get('title', 'N/A')[:70]}...")
+                        print(f"     Authors: {', '.join(ref.get('authors', []))[:70]}...")
+                        print(f"     Year: {ref.get('submitted_date', 'N/A')[:4]}")
+                        print(f"     Reason: {reason}")
+                
+                print(f"\n{'='*70}")
+                response = input("Enter choice (1-5 for suggestion, arXiv ID, 's' to skip, 'q' to quit): ").strip()
+                
+                if response.lower() == 'q':
+                    break
+                elif response.lower() == 's':
+                    continue
+                elif response.isdigit() and 1 <= int(response) <= len(suggestions):
+                    # Use suggestion
+                    arxiv_id = suggestions[int(response) - 1][0]
+                    self.labels[pub_id][bib_key] = arxiv_id
+                    print(f"[OK] Labeled: {bib_key} = {arxiv_id}")
+                elif response in references:
+                    # Direct arXiv ID input
+                    self.labels[pub_id][bib_key] = response
+                    print(f"[OK] Labeled: {bib_key} = {response}")
+                else:
+                    print("[ERROR] Invalid input, skipping...")
+        finally:
+            # Drop prefetch work left over after quitting
+            prefetch.shutdown(cancel_futures=True)
         
         # Save after each publication
         self.save_labels()
     
     def save_labels(self):
         """Save labels to file"""
-        with open(self.labels_file, 'w', encoding='utf-8') as f:
-            json.dump(self.labels, f, indent=2, ensure_ascii=False)
+        if not write_json_safe(self.labels, self.labels_file):
+            print(f"\n[ERROR] Labels were NOT saved to {self.labels_file}")
+            return
         
         # Count total pairs
         total_pairs = sum(len(pairs) for pairs in self.labels.values())
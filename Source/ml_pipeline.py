@@ -2,34 +2,289 @@
 ML Training Pipeline
 Complete pipeline for training and evaluating reference matching model
 """
-import json
+import sys
+import hashlib
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from reference_matching import ReferenceMatchingModel, compute_mrr
-from utils import load_json_safe, save_json_safe
+import bibtex_processor
+import reference_matching
+import utils
+from utils import load_json_safe, save_json_safe, compute_file_content_hash
+
+
+def _code_digest(*modules) -> str:
+    """Hash of the given modules' source files, so caches follow code changes"""
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(compute_file_content_hash(Path(module.__file__)).encode())
+    return digest.hexdigest()
+
+
+def _package_version(name: str) -> str:
+    """Installed version of a package, or 'none'"""
+    from importlib import metadata
+    
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return 'none'
 
 
 class MLPipeline:
     """Complete ML pipeline for reference matching"""
     
-    def __init__(self, output_dir: Path, labels_dir: Path):
+    # Easy negatives (no shared title token, different year) kept per positive
+    NEGATIVE_RATIO = 3
+    
+    def __init__(self, output_dir: Path, labels_dir: Path, use_cache: bool = True):
         """
         Initialize ML pipeline
         
         Args:
             output_dir: Directory containing processed publications
             labels_dir: Directory containing manual and auto labels
+            use_cache: Reuse feature grids and the trained model from
+                       previous runs (kept in labels_dir/.cache) when their
+                       inputs and code are unchanged
         """
         self.output_dir = Path(output_dir)
         self.labels_dir = Path(labels_dir)
         self.model = ReferenceMatchingModel()
+        self.use_cache = use_cache
+        self.cache_dir = self.labels_dir / '.cache'
+        self.model_cache_file = self.cache_dir / 'model.joblib'
+        
+        # Cache keys include the code that produces features / the model, so
+        # editing it invalidates stale caches without any manual version bump
+        self._feature_version = _code_digest(utils, bibtex_processor, reference_matching)
+        self._training_version = '\0'.join([
+            _code_digest(utils, bibtex_processor, reference_matching, sys.modules[__name__]),
+            _package_version('lightgbm'),
+            _package_version('scikit-learn')
+        ])
+        
+        self._parser = bibtex_processor.BibTeXParser()
+        self._pub_cache: Dict[str, Optional[Tuple[List, Dict]]] = {}
+        self._pub_digests: Dict[str, Optional[str]] = {}
+        self._feature_cache: Dict[str, Optional[Dict]] = {}
         
         self.train_pubs = []
         self.valid_pubs = []
         self.test_pubs = []
     
+    def _load_label_files(self, paths: List[Path]) -> List[Dict]:
+        """
+        Load label files concurrently (I/O bound, so threads suffice)
+        
+        Args:
+            paths: Label file paths
+            
+        Returns:
+            Loaded labels in the same order as paths (None for failures)
+        """
+        if not paths:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(32, len(paths))) as executor:
+            return list(executor.map(load_json_safe, paths))
+    
+    def _load_pub(self, pub_id: str) -> Optional[Tuple[List, Dict]]:
+        """
+        Load a publication's parsed BibTeX entries and references, once
+        
+        Training and each evaluation pass read the same publications, so the
+        parsed result is cached per pub_id.
+        
+        Args:
+            pub_id: Publication ID
+            
+        Returns:
+            (bib_entries, ref_entries_dict) or None if either file is missing/empty
+        """
+        if pub_id in self._pub_cache:
+            return self._pub_cache[pub_id]
+        
+        pub_dir = self.output_dir / pub_id
+        loaded = None
+        
+        # Load BibTeX entries
+        refs_bib = pub_dir / 'refs.bib'
+        bib_entries = self._parser.parse_bib_file(refs_bib) if refs_bib.exists() else None
+        
+        # Load references
+        refs_json = pub_dir / 'references.json'
+        if bib_entries and refs_json.exists():
+            refs_data = load_json_safe(refs_json)
+            if refs_data:
+                # references.json is already a dict of arxiv_id -> entry
+                loaded = (bib_entries, refs_data)
+        
+        self._pub_cache[pub_id] = loaded
+        return loaded
+    
+    def _pub_digest(self, pub_id: str) -> Optional[str]:
+        """
+        Hash of a publication's refs.bib and references.json
+        
+        Args:
+            pub_id: Publication ID
+            
+        Returns:
+            Hex digest, or None if either file cannot be read
+        """
+        if pub_id not in self._pub_digests:
+            pub_dir = self.output_dir / pub_id
+            digest = hashlib.sha256(self._feature_version.encode())
+            try:
+                for filename in ['refs.bib', 'references.json']:
+                    digest.update(compute_file_content_hash(pub_dir / filename).encode())
+                self._pub_digests[pub_id] = digest.hexdigest()
+            except OSError:
+                self._pub_digests[pub_id] = None
+        
+        return self._pub_digests[pub_id]
+    
+    def _pub_features(self, pub_id: str) -> Optional[Dict]:
+        """
+        Feature grid of every (BibTeX entry, reference) pair of a publication
+        
+        Computed once per run and stored in cache_dir/{pub_id}_features.npz
+        together with a hash of the inputs and feature code, so later runs
+        skip parsing and feature extraction for unchanged publications.
+        
+        Args:
+            pub_id: Publication ID
+            
+        Returns:
+            None if the publication has no data, otherwise a dictionary with:
+                'bib_keys', 'arxiv_ids': row and column labels of the grid
+                'grid': (m, n, features) array of (bib_keys[i], arxiv_ids[j]) features
+                'train_has_arxiv_id': (m, n) has_arxiv_id values as seen in
+                    training, which matches each reference's own 'arxiv_id' field
+                    instead of its references.json key
+        """
+        if pub_id in self._feature_cache:
+            return self._feature_cache[pub_id]
+        
+        digest = self._pub_digest(pub_id)
+        cache_file = self.cache_dir / f"{pub_id}_features.npz"
+        features = None
+        
+        if self.use_cache and digest and cache_file.exists():
+            try:
+                with np.load(cache_file) as cached:
+                    if str(cached['key']) == digest:
+                        features = {
+                            'bib_keys': cached['bib_keys'].tolist(),
+                            'arxiv_ids': cached['arxiv_ids'].tolist(),
+                            'grid': cached['grid'],
+                            'train_has_arxiv_id': cached['train_has_arxiv_id']
+                        }
+            except (OSError, ValueError, KeyError):
+                features = None
+        
+        if features is None and digest:
+            loaded = self._load_pub(pub_id)
+            if loaded is not None:
+                bib_entries, ref_entries_dict = loaded
+                extractor = self.model.feature_extractor
+                
+                # Normalize/tokenize each entry once; the vocabulary is shared
+                # by the whole publication for bitset set features
+                vocab = {}
+                keyed_entries = [entry for entry in bib_entries if entry.cite_key]
+                bibs = [extractor.prepare_bib_entry(entry, vocab) for entry in keyed_entries]
+                arxiv_ids = list(ref_entries_dict.keys())
+                refs = [extractor.prepare_ref_entry(ref_entries_dict[arxiv_id], arxiv_id, vocab)
+                        for arxiv_id in arxiv_ids]
+                
+                features = {
+                    'bib_keys': [entry.cite_key for entry in keyed_entries],
+                    'arxiv_ids': arxiv_ids,
+                    'grid': extractor.pair_feature_matrix(bibs, refs),
+                    'train_has_arxiv_id': extractor.arxiv_id_matrix(
+                        bibs, [ref_entries_dict[arxiv_id].get('arxiv_id', '') for arxiv_id in arxiv_ids])
+                }
+                
+                if self.use_cache:
+                    try:
+                        self.cache_dir.mkdir(parents=True, exist_ok=True)
+                        np.savez(cache_file, key=np.array(digest),
+                                 bib_keys=np.array(features['bib_keys'], dtype=str),
+                                 arxiv_ids=np.array(arxiv_ids, dtype=str),
+                                 grid=features['grid'],
+                                 train_has_arxiv_id=features['train_has_arxiv_id'])
+                    except OSError as e:
+                        print(f"  Warning: Could not cache features for {pub_id}: {e}")
+        
+        self._feature_cache[pub_id] = features
+        return features
+    
+    def _training_key(self, train_pubs: List[str], all_labels: Dict[str, Dict]) -> str:
+        """
+        Hash of everything the trained model depends on
+        
+        Args:
+            train_pubs: List of training publication IDs
+            all_labels: All labels dictionary
+            
+        Returns:
+            Hex digest
+        """
+        digest = hashlib.sha256(f"{self._training_version}\0{self.NEGATIVE_RATIO}".encode())
+        for pub_id in train_pubs:
+            groundtruth = all_labels[pub_id].get('groundtruth', {})
+            digest.update(f"{pub_id}\0{self._pub_digest(pub_id)}\0{sorted(groundtruth.items())!r}\0".encode())
+        
+        return digest.hexdigest()
+    
+    def _load_cached_model(self, key: str) -> bool:
+        """
+        Load the trained model saved by a previous run if its key matches
+        
+        Args:
+            key: Expected training key
+            
+        Returns:
+            True if the cached model was loaded
+        """
+        if not self.model_cache_file.exists():
+            return False
+        
+        try:
+            import joblib
+            
+            cached = joblib.load(self.model_cache_file)
+        except Exception:
+            return False
+        
+        if not isinstance(cached, dict) or cached.get('key') != key or 'quantized' not in cached:
+            return False
+        
+        self.model.model = cached['model']
+        self.model.quantized = cached['quantized']
+        return True
+    
+    def _save_cached_model(self, key: str):
+        """
+        Save the trained model for reuse by later runs
+        
+        Args:
+            key: Training key the model was built from
+        """
+        try:
+            import joblib
+            
+            self.model_cache_file.parent.mkdir(parents=True, exist_ok=True)
+            joblib.dump({'key': key, 'model': self.model.model, 'quantized': self.model.quantized},
+                        self.model_cache_file, compress=3)
+        except Exception as e:
+            print(f"  Warning: Could not cache model: {e}")
+    
     def load_all_labels(self) -> Dict[str, Dict]:
         """
         Load all labeled data (manual + auto)
@@ -42,8 +297,7 @@ class MLPipeline:
         # Load manual labels
         manual_dir = self.labels_dir / 'manual'
         if manual_dir.exists():
-            for label_file in manual_dir.glob('*_labels.json'):
-                labels = load_json_safe(label_file)
+            for labels in self._load_label_files(list(manual_dir.glob('*_labels.json'))):
                 if labels and 'pub_id' in labels:
                     pub_id = labels['pub_id']
                     # Ensure source is set correctly
@@ -55,8 +309,7 @@ class MLPipeline:
         # Load auto labels (but don't overwrite manual labels)
         auto_dir = self.labels_dir / 'auto'
         if auto_dir.exists():
-            for label_file in auto_dir.glob('*_auto_labels.json'):
-                labels = load_json_safe(label_file)
+            for labels in self._load_label_files(list(auto_dir.glob('*_auto_labels.json'))):
                 if labels and 'pub_id' in labels:
                     pub_id = labels['pub_id']
                     # Skip if manual label already exists for this pub
@@ -140,74 +393,100 @@ class MLPipeline:
         
         return train_pubs, valid_pubs, test_pubs
     
-    def create_training_pairs(self, pub_ids: List[str], all_labels: Dict[str, Dict]) -> List[Dict]:
+    def create_training_pairs(self, pub_ids: List[str], all_labels: Dict[str, Dict],
+                              negative_ratio: Optional[int] = NEGATIVE_RATIO) -> Dict:
         """
         Create all (bib_entry, ref_entry, label) pairs for training
         
         Following requirements: For each publication with m BibTeX entries and n references,
         create m × n pairs with binary labels.
         
+        Pairs are stored as parallel index arrays into per-publication feature
+        grids rather than one dict per pair. All positives and hard negatives
+        (sharing a title token or the year) are kept; the trivially
+        non-matching rest is randomly sampled down to negative_ratio per positive.
+        
         Args:
             pub_ids: List of publication IDs
             all_labels: All labels dictionary
+            negative_ratio: Easy negatives kept per positive (None keeps all pairs)
             
         Returns:
-            List of training examples
+            Dictionary with:
+                'features': per-publication (m, n, features) grids
+                'pub_idx', 'bib_idx', 'ref_idx': int32 arrays locating each pair
+                'labels': int8 array, 1 if the pair is the correct match
         """
-        from bibtex_processor import BibTeXParser
-        
-        parser = BibTeXParser()
-        training_examples = []
+        pub_grids = []
+        pub_correct = []  # per publication: index of the correct reference per bib, or -1
         
         for pub_id in pub_ids:
-            pub_dir = self.output_dir / pub_id
-            
-            # Load BibTeX entries
-            refs_bib = pub_dir / 'refs.bib'
-            if not refs_bib.exists():
+            features = self._pub_features(pub_id)
+            if features is None:
                 continue
             
-            bib_entries = parser.parse_bib_file(refs_bib)
-            if not bib_entries:
-                continue
+            bib_keys = features['bib_keys']
+            grid = features['grid']
             
-            # Load references
-            refs_json = pub_dir / 'references.json'
-            if not refs_json.exists():
-                continue
-            
-            refs_data = load_json_safe(refs_json)
-            if not refs_data:
-                continue
-            
-            # references.json is already a dict of arxiv_id -> entry
-            ref_entries_dict = refs_data
+            # Training has always matched has_arxiv_id against each reference's
+            # own 'arxiv_id' field; keep that unless it equals the shared grid
+            has_arxiv_id = self.model.feature_names.index('has_arxiv_id')
+            if not np.array_equal(grid[:, :, has_arxiv_id], features['train_has_arxiv_id']):
+                grid = grid.copy()
+                grid[:, :, has_arxiv_id] = features['train_has_arxiv_id']
             
             # Get groundtruth for this publication
             groundtruth = all_labels[pub_id].get('groundtruth', {})
             
-            # Create m × n pairs
-            for bib_entry in bib_entries:
-                bib_key = bib_entry.cite_key
-                if not bib_key:
-                    continue
-                
-                correct_arxiv_id = groundtruth.get(bib_key)
-                
-                for arxiv_id, ref_entry in ref_entries_dict.items():
-                    # Label: 1 if this is the correct match, 0 otherwise
-                    label = 1 if arxiv_id == correct_arxiv_id else 0
-                    
-                    training_examples.append({
-                        'pub_id': pub_id,
-                        'bib_key': bib_key,
-                        'arxiv_id': arxiv_id,
-                        'bib_entry': bib_entry,
-                        'ref_entry': ref_entry,
-                        'label': label
-                    })
-        
-        return training_examples
+            ref_index = {arxiv_id: j for j, arxiv_id in enumerate(features['arxiv_ids'])}
+            pub_grids.append(grid)
+            pub_correct.append([ref_index.get(groundtruth.get(bib_key), -1) for bib_key in bib_keys])
+        
+        # Allocate the exact number of m × n pairs up front
+        total = sum(grid.shape[0] * grid.shape[1] for grid in pub_grids)
+        pub_idx = np.empty(total, dtype=np.int32)
+        bib_idx = np.empty(total, dtype=np.int32)
+        ref_idx = np.empty(total, dtype=np.int32)
+        labels = np.zeros(total, dtype=np.int8)
+        hard = np.empty(total, dtype=bool)
+        
+        offset = 0
+        for p, (grid, correct) in enumerate(zip(pub_grids, pub_correct)):
+            m, n = grid.shape[:2]
+            block = slice(offset, offset + m * n)
+            pub_idx[block] = p
+            bib_idx[block] = np.repeat(np.arange(m, dtype=np.int32), n)
+            ref_idx[block] = np.tile(np.arange(n, dtype=np.int32), m)
+            
+            # Cheap prefilter: any title token overlap or the same year
+            flat = grid.reshape(m * n, -1)
+            hard[block] = (flat[:, 0] > 0) | (flat[:, 5] == 1.0)
+            
+            # Label: 1 if this is the correct match, 0 otherwise
+            for i, j in enumerate(correct):
+                if j >= 0:
+                    labels[offset + i * n + j] = 1
+            
+            offset += m * n
+        
+        if negative_ratio is not None:
+            # Keep positives and hard negatives; sample the easy negatives
+            easy = (labels == 0) & ~hard
+            num_easy = int(easy.sum())
+            if num_easy:
+                keep_prob = min(1.0, negative_ratio * int(labels.sum()) / num_easy)
+                rng = np.random.default_rng(42)
+                keep = ~easy | (rng.random(total) < keep_prob)
+                pub_idx, bib_idx, ref_idx, labels = (pub_idx[keep], bib_idx[keep],
+                                                     ref_idx[keep], labels[keep])
+        
+        return {
+            'features': pub_grids,
+            'pub_idx': pub_idx,
+            'bib_idx': bib_idx,
+            'ref_idx': ref_idx,
+            'labels': labels
+        }
     
     def train_model(self, train_pubs: List[str], all_labels: Dict[str, Dict]):
         """
@@ -219,20 +498,30 @@ class MLPipeline:
         """
         print(f"\nTraining Model...")
         
+        # Reuse the model of a previous run trained on identical inputs
+        training_key = self._training_key(train_pubs, all_labels) if self.use_cache else None
+        if training_key and self._load_cached_model(training_key):
+            print(f"[OK] Loaded cached model from {self.model_cache_file}")
+            return
+        
         # Create training pairs
-        training_examples = self.create_training_pairs(train_pubs, all_labels)
+        training_pairs = self.create_training_pairs(train_pubs, all_labels)
         
-        positive = sum(1 for ex in training_examples if ex['label'] == 1)
-        negative = len(training_examples) - positive
-        print(f"  Training examples: {len(training_examples)} ({positive} positive, {negative} negative)")
+        total = len(training_pairs['labels'])
+        positive = int(training_pairs['labels'].sum())
+        negative = total - positive
+        print(f"  Training examples: {total} ({positive} positive, {negative} negative)")
         
         # Extract features and labels
-        X, y = self.model.create_training_data(training_examples)
+        X, y = self.model.create_training_data_from_pairs(training_pairs)
         print(f"  Features: {X.shape[1]} dimensions")
         
         # Train model
         self.model.train(X, y)
         print("[OK] Model trained")
+        
+        if training_key:
+            self._save_cached_model(training_key)
     
     def evaluate_and_generate_predictions(self, eval_pubs: List[str], all_labels: Dict[str, Dict],
                                          partition_name: str) -> Dict[str, float]:
@@ -247,83 +536,67 @@ class MLPipeline:
         Returns:
             Dictionary of metrics
         """
-        from bibtex_processor import BibTeXParser
-        
-        parser = BibTeXParser()
-        
         all_predictions = {}
         all_groundtruth = {}
         
         print(f"\nEvaluating {partition_name} set...")
         
-        for pub_id in eval_pubs:
-            pub_dir = self.output_dir / pub_id
-            
-            # Load BibTeX entries
-            refs_bib = pub_dir / 'refs.bib'
-            if not refs_bib.exists():
-                continue
-            
-            bib_entries = parser.parse_bib_file(refs_bib)
-            if not bib_entries:
-                continue
-            
-            # Create dictionary keyed by bib_key
-            bib_dict = {}
-            for entry in bib_entries:
-                bib_key = entry.cite_key
-                if bib_key:
-                    bib_dict[bib_key] = entry
-            
-            # Load references
-            refs_json = pub_dir / 'references.json'
-            if not refs_json.exists():
-                continue
-            
-            refs_data = load_json_safe(refs_json)
-            if not refs_data:
-                continue
-            
-            # references.json is already a dict of arxiv_id -> entry
-            ref_entries_dict = refs_data
-            
-            # Get groundtruth
-            groundtruth = all_labels[pub_id].get('groundtruth', {})
-            
-            # Generate predictions for each BibTeX entry
-            pub_predictions = {}
-            pub_groundtruth = {}
-            
-            for bib_key, bib_entry in bib_dict.items():
-                if bib_key not in groundtruth:
-                    continue  # Skip entries without groundtruth
+        # pred.json files are written in the background as each publication
+        # finishes; leaving the block waits for every submitted write
+        with ThreadPoolExecutor(max_workers=4) as writer:
+            for pub_id in eval_pubs:
+                pub_dir = self.output_dir / pub_id
                 
-                # Rank candidates
-                top_candidates = self.model.rank_candidates(bib_entry, ref_entries_dict, top_k=5)
+                features = self._pub_features(pub_id)
+                if features is None:
+                    continue
                 
-                # Extract just the arxiv_ids
-                candidate_ids = [arxiv_id for arxiv_id, score in top_candidates]
+                bib_keys = features['bib_keys']
+                arxiv_ids = features['arxiv_ids']
+                grid = features['grid']
                 
-                pub_predictions[bib_key] = candidate_ids
-                pub_groundtruth[bib_key] = groundtruth[bib_key]
-            
-            # Save pred.json for this publication
-            pred_data = {
-                'partition': partition_name,
-                'groundtruth': pub_groundtruth,
-                'prediction': pub_predictions
-            }
-            
-            pred_file = pub_dir / 'pred.json'
-            save_json_safe(pred_data, pred_file)
-            
-            # Accumulate for overall metrics
-            all_predictions.update(pub_predictions)
-            all_groundtruth.update(pub_groundtruth)
-            
-            # Compute MRR for this publication
-            pub_mrr = compute_mrr(pub_predictions, pub_groundtruth)
-            print(f"  {pub_id}: MRR = {pub_mrr:.4f} ({len(pub_groundtruth)} queries)")
+                # Feature grid row of each bib_key (the last entry wins for duplicates)
+                bib_rows = {}
+                for i, bib_key in enumerate(bib_keys):
+                    bib_rows[bib_key] = i
+                
+                # Get groundtruth
+                groundtruth = all_labels[pub_id].get('groundtruth', {})
+                
+                # Generate predictions for each BibTeX entry
+                pub_predictions = {}
+                pub_groundtruth = {}
+                
+                # Skip entries without groundtruth
+                query_keys = [bib_key for bib_key in bib_rows if bib_key in groundtruth]
+                query_rows = np.array([bib_rows[bib_key] for bib_key in query_keys], dtype=np.intp)
+                
+                # Rank candidates for all entries with a single model call
+                ranked = self.model.rank_feature_grid(grid[query_rows], arxiv_ids, top_k=5)
+                
+                for bib_key, top_candidates in zip(query_keys, ranked):
+                    # Extract just the arxiv_ids
+                    candidate_ids = [arxiv_id for arxiv_id, score in top_candidates]
+                    
+                    pub_predictions[bib_key] = candidate_ids
+                    pub_groundtruth[bib_key] = groundtruth[bib_key]
+                
+                # Save pred.json for this publication
+                pred_data = {
+                    'partition': partition_name,
+                    'groundtruth': pub_groundtruth,
+                    'prediction': pub_predictions
+                }
+                
+                writer.submit(save_json_safe, pred_data, pub_dir / 'pred.json')
+                
+                # Accumulate for overall metrics
+                all_predictions.update(pub_predictions)
+                all_groundtruth.update(pub_groundtruth)
+                
+                # Compute MRR for this publication
+                pub_mrr = compute_mrr(pub_predictions, pub_groundtruth)
+                print(f"  {pub_id}: MRR = {pub_mrr:.4f} ({len(pub_groundtruth)} queries)")
         
         # Compute overall MRR
         overall_mrr = compute_mrr(all_predictions, all_groundtruth)
@@ -5,9 +5,76 @@ Machine Learning pipeline for matching BibTeX entries to arXiv IDs
 import re
 import json
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, FrozenSet
 from pathlib import Path
 from collections import defaultdict
+from dataclasses import dataclass, field
+
+try:
+    from rapidfuzz import process as rf_process
+    from rapidfuzz.distance import Levenshtein as rf_levenshtein
+except ImportError:
+    rf_process = None
+    rf_levenshtein = None
+
+
+# Length of the feature vector produced by ReferenceFeatureExtractor
+NUM_FEATURES = 7
+
+# Every feature lies in [0, 1]; histogram-based models see them as 256 levels
+FEATURE_LEVELS = 255
+
+_YEAR_RE = re.compile(r'\d{4}')
+
+# arXiv identifiers: new style YYMM.NNNNN (also written YYMM-NNNNN) and old
+# style archive/YYMMNNN, each with an optional version suffix
+_ARXIV_RE = re.compile(r'(?<![\w.])(?:(\d{4})[.-](\d{4,5})|([a-z][a-z.-]*/\d{7}))(?:v\d+)?(?!\d)')
+_PUNCT_RE = re.compile(r'[^a-z0-9\s]')
+_WS_RE = re.compile(r'\s+')
+
+# ASCII-only equivalent of _PUNCT_RE for str.translate (applied after lower())
+_PUNCT_TABLE = {c: ' ' for c in range(128) if not (chr(c).isalnum() or chr(c).isspace())}
+
+
+@dataclass
+class PreppedEntry:
+    """Per-entry values reused across every pair the entry takes part in"""
+    title: str                      # raw title (presence and length ratio)
+    title_norm: str                 # normalize_string(title)
+    title_tokens: FrozenSet[str]    # tokenize(title) as a set
+    has_authors: bool               # author list is non-empty
+    n_authors: int                  # length of the raw author list
+    author_set: FrozenSet[str]      # normalized author names
+    last_name_set: FrozenSet[str]   # last token of each normalized name
+    year: Optional[int]             # first 4-digit year, if any
+    arxiv_id: str = ''              # canonical reference arXiv ID (refs only)
+    arxiv_tokens: FrozenSet[str] = frozenset()  # canonical arXiv IDs found in the entry (bibs only)
+    
+    # Bitset forms of the sets above, with bit positions from a shared
+    # per-publication vocabulary; only comparable between entries sharing it
+    vocab: Optional[Dict[str, int]] = field(default=None, repr=False, compare=False)
+    token_bits: int = 0
+    author_bits: int = 0
+    last_name_bits: int = 0
+
+
+def _arxiv_tokens(text: str) -> FrozenSet[str]:
+    """Canonical (dotted, unversioned, lowercase) arXiv IDs appearing in text"""
+    tokens = set()
+    for yymm, number, old_style in _ARXIV_RE.findall(text.lower()):
+        tokens.add(old_style or f'{yymm}.{number}')
+    return frozenset(tokens)
+
+
+def _intern_bits(items, vocab: Dict[str, int]) -> int:
+    """Map items to bit positions in vocab (assigning new ones) and OR them together"""
+    bits = 0
+    for item in items:
+        bit = vocab.get(item)
+        if bit is None:
+            bit = vocab[item] = len(vocab)
+        bits |= 1 << bit
+    return bits
 
 
 class ReferenceFeatureExtractor:
@@ -25,11 +92,14 @@ class ReferenceFeatureExtractor:
         # Convert to lowercase
         text = text.lower()
         
-        # Remove special characters
-        text = re.sub(r'[^a-z0-9\s]', ' ', text)
+        # Remove special characters (C-level translate for pure ASCII)
+        if text.isascii():
+            text = text.translate(_PUNCT_TABLE)
+        else:
+            text = _PUNCT_RE.sub(' ', text)
         
         # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _WS_RE.sub(' ', text).strip()
         
         return text
     
@@ -53,15 +123,11 @@ class ReferenceFeatureExtractor:
         
         return intersection / union if union > 0 else 0.0
     
-    def token_overlap_ratio(self, tokens1: List[str], tokens2: List[str]) -> float:
-        """Compute token overlap ratio"""
-        set1 = set(tokens1)
-        set2 = set(tokens2)
-        
-        return self.jaccard_similarity(set1, set2)
-    
     def levenshtein_distance(self, s1: str, s2: str) -> int:
         """Compute Levenshtein distance between two strings"""
+        if rf_levenshtein is not None:
+            return rf_levenshtein.distance(s1, s2)
+        
         if len(s1) < len(s2):
             return self.levenshtein_distance(s2, s1)
         
@@ -82,148 +148,280 @@ class ReferenceFeatureExtractor:
     
     def normalized_levenshtein(self, s1: str, s2: str) -> float:
         """Normalized Levenshtein similarity (0 to 1)"""
+        if rf_levenshtein is not None:
+            return rf_levenshtein.normalized_similarity(s1, s2)
+        
         distance = self.levenshtein_distance(s1, s2)
         max_len = max(len(s1), len(s2))
         
         return 1.0 - (distance / max_len) if max_len > 0 else 1.0
     
-    def author_similarity(self, authors1: List[str], authors2: List[str]) -> float:
+    def prepped_author_similarity(self, entry1: 'PreppedEntry', entry2: 'PreppedEntry') -> float:
         """
-        Compute similarity between author lists
+        Compute similarity between the author lists of two prepared entries
+        
+        Uses the author/last-name sets built once per entry, so a pair costs
+        two set intersections (popcounts if the entries share a vocabulary).
         
         Args:
-            authors1: List of author names
-            authors2: List of author names
+            entry1: Prepared entry
+            entry2: Prepared entry
             
         Returns:
             Similarity score (0 to 1)
         """
-        if not authors1 or not authors2:
+        if not entry1.has_authors or not entry2.has_authors:
             return 0.0
         
-        # Normalize author names
-        norm_authors1 = [self.normalize_string(a) for a in authors1]
-        norm_authors2 = [self.normalize_string(a) for a in authors2]
-        
-        # Check for exact matches
-        set1 = set(norm_authors1)
-        set2 = set(norm_authors2)
-        
-        exact_matches = len(set1 & set2)
-        total_authors = max(len(set1), len(set2))
-        
-        exact_score = exact_matches / total_authors if total_authors > 0 else 0.0
+        if entry1.vocab is not None and entry1.vocab is entry2.vocab:
+            exact_matches = (entry1.author_bits & entry2.author_bits).bit_count()
+            partial_matches = (entry1.last_name_bits & entry2.last_name_bits).bit_count()
+        else:
+            exact_matches = len(entry1.author_set & entry2.author_set)
+            partial_matches = len(entry1.last_name_set & entry2.last_name_set)
         
-        # Check for partial matches (last names)
-        def get_last_name(name: str) -> str:
+        return self._author_score(exact_matches, partial_matches,
+                                  max(len(entry1.author_set), len(entry2.author_set)))
+    
+    def _author_sets(self, authors: List[str]) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+        """Normalized author names and their last names, as sets"""
+        norm_authors = [self.normalize_string(a) for a in authors]
+        last_names = []
+        for name in norm_authors:
             parts = name.split()
-            return parts[-1] if parts else ""
+            last_names.append(parts[-1] if parts else "")
         
-        last_names1 = set([get_last_name(a) for a in norm_authors1])
-        last_names2 = set([get_last_name(a) for a in norm_authors2])
+        return frozenset(norm_authors), frozenset(last_names)
+    
+    @staticmethod
+    def _author_score(exact_matches: int, partial_matches: int, total_authors: int) -> float:
+        """Weighted combination of exact (full name) and partial (last name) matches"""
+        if total_authors == 0:
+            return 0.0
         
-        partial_matches = len(last_names1 & last_names2)
-        partial_score = partial_matches / total_authors if total_authors > 0 else 0.0
+        exact_score = exact_matches / total_authors
+        partial_score = partial_matches / total_authors
         
-        # Weighted combination
         return 0.7 * exact_score + 0.3 * partial_score
     
-    def year_similarity(self, year1: Optional[str], year2: Optional[str]) -> float:
+    def _parse_year(self, year: Optional[str]) -> Optional[int]:
+        """Extract the first 4-digit year from a string, or None"""
+        if not year:
+            return None
+        try:
+            return int(_YEAR_RE.search(year).group())
+        except (AttributeError, TypeError):
+            return None
+    
+    def _prepare(self, title: str, authors: List[str], year: Optional[str],
+                 arxiv_id: str = '', text: str = '',
+                 vocab: Optional[Dict[str, int]] = None) -> 'PreppedEntry':
+        """Build a PreppedEntry from raw title/author/year values"""
+        author_set, last_name_set = self._author_sets(authors)
+        
+        entry = PreppedEntry(
+            title=title,
+            title_norm=self.normalize_string(title),
+            title_tokens=frozenset(self.tokenize(title)),
+            has_authors=bool(authors),
+            n_authors=len(authors),
+            author_set=author_set,
+            last_name_set=last_name_set,
+            year=self._parse_year(year),
+            arxiv_id=next(iter(_arxiv_tokens(arxiv_id)), '') if arxiv_id else '',
+            arxiv_tokens=_arxiv_tokens(text) if text else frozenset()
+        )
+        
+        if vocab is not None:
+            entry.vocab = vocab
+            entry.token_bits = _intern_bits(entry.title_tokens, vocab)
+            entry.author_bits = _intern_bits(entry.author_set, vocab)
+            entry.last_name_bits = _intern_bits(entry.last_name_set, vocab)
+        
+        return entry
+    
+    def prepare_bib_entry(self, bib_entry,
+                          vocab: Optional[Dict[str, int]] = None) -> 'PreppedEntry':
         """
-        Compute similarity between years
+        Precompute everything extract_features needs from a BibTeX entry
         
         Args:
-            year1: Year string
-            year2: Year string
+            bib_entry: BibEntry object or fields dictionary
+            vocab: Optional per-publication vocabulary for bitset features
             
         Returns:
-            1.0 if same year, 0.5 if within 1 year, 0.0 otherwise
+            PreppedEntry
         """
-        if not year1 or not year2:
-            return 0.0
+        # Handle BibEntry object or dict
+        bib_data = bib_entry.fields if hasattr(bib_entry, 'fields') else bib_entry
         
-        try:
-            y1 = int(re.search(r'\d{4}', year1).group())
-            y2 = int(re.search(r'\d{4}', year2).group())
-            
-            diff = abs(y1 - y2)
-            if diff == 0:
-                return 1.0
-            elif diff == 1:
-                return 0.5
-            else:
-                return 0.0
-        except:
-            return 0.0
+        authors = bib_data.get('author', '')
+        if isinstance(authors, str):
+            authors = [a.strip() for a in authors.split(' and ')]
+        
+        year = bib_data.get('year', '') or bib_data.get('submitted_date', '')
+        
+        return self._prepare(bib_data.get('title', ''), authors, year,
+                             text=str(bib_data), vocab=vocab)
     
-    def extract_features(self, bib_entry: Dict, ref_entry: Dict) -> np.ndarray:
+    def prepare_ref_entry(self, ref_entry: Dict, arxiv_id: Optional[str] = None,
+                          vocab: Optional[Dict[str, int]] = None) -> 'PreppedEntry':
         """
-        Extract feature vector for a (bib_entry, ref_entry) pair
+        Precompute everything extract_features needs from a references.json entry
         
         Args:
-            bib_entry: BibTeX entry dictionary
             ref_entry: Reference entry from references.json
+            arxiv_id: arXiv ID of the entry (defaults to ref_entry['arxiv_id'])
+            vocab: Optional per-publication vocabulary for bitset features
             
         Returns:
-            Feature vector
+            PreppedEntry
         """
-        features = []
+        authors = ref_entry.get('authors', [])
+        if isinstance(authors, str):
+            authors = [a.strip() for a in authors.split(',')]
         
-        # Handle BibEntry object or dict
-        bib_data = bib_entry.fields if hasattr(bib_entry, 'fields') else bib_entry
+        if arxiv_id is None:
+            arxiv_id = ref_entry.get('arxiv_id', '')
         
-        # Title similarity features
-        bib_title = bib_data.get('title', '')
-        ref_title = ref_entry.get('title', '')
+        return self._prepare(ref_entry.get('title', ''), authors,
+                             ref_entry.get('submitted_date', ''), arxiv_id=arxiv_id, vocab=vocab)
+    
+    def extract_features(self, bib_entry, ref_entry,
+                         out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Extract feature vector for a (bib_entry, ref_entry) pair
         
-        if bib_title and ref_title:
-            # Token overlap
-            bib_tokens = self.tokenize(bib_title)
-            ref_tokens = self.tokenize(ref_title)
-            token_overlap = self.token_overlap_ratio(bib_tokens, ref_tokens)
-            features.append(token_overlap)
-            
-            # Normalized Levenshtein
-            norm_bib_title = self.normalize_string(bib_title)
-            norm_ref_title = self.normalize_string(ref_title)
-            lev_sim = self.normalized_levenshtein(norm_bib_title, norm_ref_title)
-            features.append(lev_sim)
+        Raw entries are prepared on the fly; callers comparing the same entry
+        against many others should pass PreppedEntry objects instead.
+        
+        Args:
+            bib_entry: BibTeX entry (BibEntry, dict or PreppedEntry)
+            ref_entry: Reference entry from references.json (dict or PreppedEntry)
+            out: Optional preallocated row of NUM_FEATURES floats to write into
             
-            # Title length ratio
-            len_ratio = min(len(bib_title), len(ref_title)) / max(len(bib_title), len(ref_title))
-            features.append(len_ratio)
+        Returns:
+            Feature vector (out, if given)
+        """
+        bib = bib_entry if isinstance(bib_entry, PreppedEntry) else self.prepare_bib_entry(bib_entry)
+        ref = ref_entry if isinstance(ref_entry, PreppedEntry) else self.prepare_ref_entry(ref_entry)
+        
+        # A 1 x 1 grid, so both paths share one implementation of each feature
+        features = self.pair_feature_matrix([bib], [ref])[0, 0]
+        if out is None:
+            return features
+        
+        out[:] = features
+        return out
+    
+    def _pair_set_features(self, bib: PreppedEntry, ref: PreppedEntry, out: np.ndarray):
+        """
+        Write the set based features (token overlap, author similarity,
+        arXiv ID) of one pair into out[0], out[3], out[6]
+        """
+        # Set intersections become popcounts when both share a vocabulary
+        use_bits = bib.vocab is not None and bib.vocab is ref.vocab
+        
+        # Title token overlap
+        if bib.title and ref.title:
+            if use_bits:
+                union = (bib.token_bits | ref.token_bits).bit_count()
+                if bib.token_bits and ref.token_bits:
+                    out[0] = (bib.token_bits & ref.token_bits).bit_count() / union
+                else:
+                    out[0] = 0.0
+            else:
+                out[0] = self.jaccard_similarity(bib.title_tokens, ref.title_tokens)
         else:
-            features.extend([0.0, 0.0, 0.0])
+            out[0] = 0.0
         
         # Author similarity
-        bib_authors = bib_data.get('author', '')
-        ref_authors = ref_entry.get('authors', [])
+        out[3] = self.prepped_author_similarity(bib, ref)
+        
+        # arXiv ID in BibTeX (strong indicator)
+        out[6] = 1.0 if ref.arxiv_id in bib.arxiv_tokens else 0.0
+    
+    def pair_feature_matrix(self, bibs: List[PreppedEntry], refs: List[PreppedEntry]) -> np.ndarray:
+        """
+        Extract features for every (bib, ref) pair of a publication at once
         
-        if isinstance(bib_authors, str):
-            bib_authors = [a.strip() for a in bib_authors.split(' and ')]
-        if isinstance(ref_authors, str):
-            ref_authors = [a.strip() for a in ref_authors.split(',')]
+        Numeric features (title length ratio, author count difference, year
+        similarity) are computed for the whole grid with NumPy broadcasting and
+        title Levenshtein with one rapidfuzz cdist call; only the set features
+        are computed per pair.
         
-        author_sim = self.author_similarity(bib_authors, ref_authors)
-        features.append(author_sim)
+        Args:
+            bibs: Prepared BibTeX entries (m)
+            refs: Prepared reference entries (n)
+            
+        Returns:
+            (m, n, NUM_FEATURES) float32 array; row [i, j] holds the features
+            of (bibs[i], refs[j])
+        """
+        m, n = len(bibs), len(refs)
+        X = np.empty((m, n, NUM_FEATURES), dtype=np.float32)
+        if m == 0 or n == 0:
+            return X
+        
+        # Title length ratio (0 where either title is missing)
+        bib_len = np.array([len(b.title) for b in bibs], dtype=np.float64)[:, None]
+        ref_len = np.array([len(r.title) for r in refs], dtype=np.float64)[None, :]
+        longest = np.maximum(bib_len, ref_len)
+        X[:, :, 2] = np.divide(np.minimum(bib_len, ref_len), longest,
+                               out=np.zeros((m, n)), where=(bib_len > 0) & (ref_len > 0))
         
         # Author count difference
-        author_count_diff = abs(len(bib_authors) - len(ref_authors))
-        features.append(min(author_count_diff, 10) / 10.0)  # Normalize to 0-1
+        bib_count = np.array([b.n_authors for b in bibs], dtype=np.int64)[:, None]
+        ref_count = np.array([r.n_authors for r in refs], dtype=np.int64)[None, :]
+        X[:, :, 4] = np.minimum(np.abs(bib_count - ref_count), 10) / 10.0
+        
+        # Year similarity (-1 marks a missing year)
+        bib_year = np.array([-1 if b.year is None else b.year for b in bibs], dtype=np.int64)[:, None]
+        ref_year = np.array([-1 if r.year is None else r.year for r in refs], dtype=np.int64)[None, :]
+        diff = np.abs(bib_year - ref_year)
+        year_sim = np.where(diff == 0, 1.0, np.where(diff == 1, 0.5, 0.0))
+        X[:, :, 5] = np.where((bib_year >= 0) & (ref_year >= 0), year_sim, 0.0)
+        
+        # Normalized Levenshtein of titles (0 where either title is missing)
+        bib_norms = [b.title_norm for b in bibs]
+        ref_norms = [r.title_norm for r in refs]
+        if rf_process is not None:
+            lev_sim = rf_process.cdist(bib_norms, ref_norms,
+                                       scorer=rf_levenshtein.normalized_similarity,
+                                       dtype=np.float64)
+        else:
+            lev_sim = np.array([[self.normalized_levenshtein(b, r) for r in ref_norms]
+                                for b in bib_norms], dtype=np.float64)
+        X[:, :, 1] = np.where((bib_len > 0) & (ref_len > 0), lev_sim, 0.0)
         
-        # Year similarity
-        bib_year = bib_data.get('year', '') or bib_data.get('submitted_date', '')
-        ref_year = ref_entry.get('submitted_date', '')
-        year_sim = self.year_similarity(bib_year, ref_year)
-        features.append(year_sim)
+        # Set features
+        for i, bib in enumerate(bibs):
+            row = X[i]
+            for j, ref in enumerate(refs):
+                self._pair_set_features(bib, ref, row[j])
         
-        # arXiv ID in BibTeX (strong indicator)
-        bib_text = str(bib_data)
-        ref_arxiv_id = ref_entry.get('arxiv_id', '')
-        has_arxiv_id = 1.0 if ref_arxiv_id and ref_arxiv_id in bib_text else 0.0
-        features.append(has_arxiv_id)
+        return X
+    
+    def arxiv_id_matrix(self, bibs: List[PreppedEntry], arxiv_ids: List[str]) -> np.ndarray:
+        """
+        has_arxiv_id feature of every (bib, arXiv ID) pair
         
-        return np.array(features)
+        Args:
+            bibs: Prepared BibTeX entries (m)
+            arxiv_ids: Raw arXiv IDs to look for (n), '' for none
+            
+        Returns:
+            (m, n) float32 array, 1.0 where bibs[i] mentions arxiv_ids[j]
+        """
+        canonical = [next(iter(_arxiv_tokens(arxiv_id)), '') if arxiv_id else ''
+                     for arxiv_id in arxiv_ids]
+        
+        X = np.zeros((len(bibs), len(canonical)), dtype=np.float32)
+        for i, bib in enumerate(bibs):
+            for j, arxiv_id in enumerate(canonical):
+                if arxiv_id in bib.arxiv_tokens:
+                    X[i, j] = 1.0
+        return X
 
 
 class ReferenceMatchingModel:
@@ -233,6 +431,8 @@ class ReferenceMatchingModel:
         """Initialize model"""
         self.feature_extractor = ReferenceFeatureExtractor()
         self.model = None
+        # Whether self.model was fitted on quantize_features output
+        self.quantized = False
         self.feature_names = [
             'title_token_overlap',
             'title_levenshtein',
@@ -243,28 +443,33 @@ class ReferenceMatchingModel:
             'has_arxiv_id'
         ]
     
-    def create_training_data(self, labeled_data: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    def create_training_data_from_pairs(self, pairs: Dict) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Create training data from labeled examples
+        Create training data from index-array pairs
         
         Args:
-            labeled_data: List of {'bib_entry': {}, 'ref_entry': {}, 'label': 0/1}
+            pairs: Output of MLPipeline.create_training_pairs (per-publication
+                   feature grids plus pub_idx/bib_idx/ref_idx/labels arrays)
             
         Returns:
             (X, y) feature matrix and labels
         """
-        X = []
-        y = []
+        labels = pairs['labels']
+        pub_idx = pairs['pub_idx']
+        bib_idx = pairs['bib_idx']
+        ref_idx = pairs['ref_idx']
         
-        for example in labeled_data:
-            features = self.feature_extractor.extract_features(
-                example['bib_entry'],
-                example['ref_entry']
-            )
-            X.append(features)
-            y.append(example['label'])
+        X = np.empty((len(labels), len(self.feature_names)), dtype=np.float32)
         
-        return np.array(X), np.array(y)
+        for p, grid in enumerate(pairs['features']):
+            rows = np.flatnonzero(pub_idx == p)
+            if len(rows) == 0:
+                continue
+            
+            # Gather the requested pairs from the publication's feature grid
+            X[rows] = grid[bib_idx[rows], ref_idx[rows]]
+        
+        return X, labels
     
     def train(self, X: np.ndarray, y: np.ndarray):
         """
@@ -274,71 +479,112 @@ class ReferenceMatchingModel:
             X: Feature matrix
             y: Labels
         """
-        from sklearn.ensemble import RandomForestClassifier
+        X = np.asarray(X, dtype=np.float32)
+        
+        try:
+            import lightgbm as lgb
+        except ImportError:
+            lgb = None
+        
+        if lgb is not None:
+            # Histogram-based boosting: faster to train and predict on tabular data.
+            # Features are pre-binned to uint8 (FEATURE_LEVELS + 1 = 256 levels);
+            # max_bin caps LightGBM at 255 bins, so adjacent levels may share one
+            self.model = lgb.LGBMClassifier(
+                n_estimators=100,
+                max_depth=10,
+                num_leaves=31,
+                max_bin=FEATURE_LEVELS,
+                n_jobs=-1,
+                random_state=42,
+                verbose=-1
+            )
+            self.quantized = True
+            X = self.quantize_features(X)
+        else:
+            from sklearn.ensemble import RandomForestClassifier
+            
+            self.model = RandomForestClassifier(
+                n_estimators=100,
+                max_depth=10,
+                random_state=42
+            )
+            self.quantized = False
         
-        self.model = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42
-        )
         self.model.fit(X, y)
     
-    def predict_proba(self, bib_entry: Dict, ref_entries: List[Dict]) -> np.ndarray:
+    @staticmethod
+    def quantize_features(X: np.ndarray) -> np.ndarray:
         """
-        Predict probability for each reference
+        Scale [0, 1] features to uint8 levels (a quarter of the float32 size)
         
         Args:
-            bib_entry: BibTeX entry
-            ref_entries: List of reference entries
+            X: Feature matrix
             
         Returns:
-            Array of probabilities
+            uint8 feature matrix
         """
-        X = []
-        for ref_entry in ref_entries:
-            features = self.feature_extractor.extract_features(bib_entry, ref_entry)
-            X.append(features)
-        
-        X = np.array(X)
+        return np.rint(np.clip(X, 0.0, 1.0) * FEATURE_LEVELS).astype(np.uint8)
+    
+    def score_features(self, X: np.ndarray) -> np.ndarray:
+        """
+        Score rows of a feature matrix
         
+        Args:
+            X: Feature matrix
+            
+        Returns:
+            Array of probabilities
+        """
         if self.model is None:
             # If no model trained, use simple heuristic
             # Return sum of features as score
             return X.sum(axis=1) / len(self.feature_names)
         
+        if self.quantized:
+            X = self.quantize_features(X)
+        
         # Return probability of positive class
         return self.model.predict_proba(X)[:, 1]
     
-    def rank_candidates(self, bib_entry: Dict, ref_entries_dict: Dict, 
-                       top_k: int = 5) -> List[Tuple[str, float]]:
+    def rank_feature_grid(self, grid: np.ndarray, arxiv_ids: List[str],
+                          top_k: int = 5) -> List[List[Tuple[str, float]]]:
         """
-        Rank candidate references for a BibTeX entry
+        Rank candidates for every row of a precomputed feature grid
         
         Args:
-            bib_entry: BibTeX entry
-            ref_entries_dict: Dictionary of arxiv_id -> reference entry
-            top_k: Number of top candidates to return
+            grid: (m, n, features) array from pair_feature_matrix
+            arxiv_ids: arXiv IDs of the n grid columns
+            top_k: Number of top candidates to return per row
             
         Returns:
-            List of (arxiv_id, score) tuples
+            For each of the m rows, a list of (arxiv_id, score) tuples
         """
-        arxiv_ids = list(ref_entries_dict.keys())
-        ref_entries = [ref_entries_dict[aid] for aid in arxiv_ids]
-        
-        # Add arxiv_id to each entry for feature extraction
-        for aid, entry in zip(arxiv_ids, ref_entries):
-            entry['arxiv_id'] = aid
-        
-        scores = self.predict_proba(bib_entry, ref_entries)
-        
-        # Sort by score descending
-        ranked_indices = np.argsort(scores)[::-1]
-        
-        top_candidates = []
-        for idx in ranked_indices[:top_k]:
-            top_candidates.append((arxiv_ids[idx], float(scores[idx])))
-        
-        return top_candidates
+        m, n = grid.shape[:2]
+        if m == 0 or n == 0:
+            return [[] for _ in range(m)]
+        
+        X = grid.reshape(m * n, len(self.feature_names))
+        probs = self.score_features(X).reshape(m, n)
+        
+        k = min(top_k, n)
+        if k <= 0:
+            return [[] for _ in range(m)]
+        
+        # k-th best score of each row in O(n); only columns reaching it can
+        # make the top k
+        kth = -np.partition(-probs, k - 1, axis=1)[:, k - 1]
+        
+        ranked = []
+        for i in range(m):
+            row = probs[i]
+            # Sort by score, breaking ties by column so equal scores keep
+            # reference order
+            cols = np.flatnonzero(row >= kth[i])
+            idx = cols[np.lexsort((cols, -row[cols]))][:k]
+            ranked.append([(arxiv_ids[j], float(row[j])) for j in idx])
+        
+        return ranked
 
 
 def compute_mrr(predictions: Dict[str, List[str]], ground_truth: Dict[str, str]) -> float:
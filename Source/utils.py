@@ -3,9 +3,29 @@ Utility functions for the project
 """
 import re
 import hashlib
+import functools
 import unicodedata
 from pathlib import Path
 from typing import List, Dict, Any, Optional
+from config import CONTENT_HASH_ALGORITHM, MATH_BLOCK_ENVS, FIGURE_ENVS, LIST_ENVS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Patterns used on every element during hierarchy building, compiled once
+_CITE_RE = re.compile(r'\\cite\*?\{([^}]+)\}')
+_CITE_KEY_RE = re.compile(r'[^,\s]+')
+
+# Environment name sets for the is_*_environment predicates
+_MATH_ENVS = frozenset(MATH_BLOCK_ENVS)
+_FIGURE_ENVS = frozenset(FIGURE_ENVS)
+_LIST_ENVS = frozenset(LIST_ENVS)
+
+# Longer inputs are mostly unique bodies, not worth keeping in the LRU cache
+_NORMALIZE_CACHE_MAX_LEN = 2048
 
 
 def normalize_text(text: str) -> str:
@@ -18,21 +38,34 @@ def normalize_text(text: str) -> str:
     Returns:
         Normalized text
     """
-    # Normalize unicode
-    text = unicodedata.normalize('NFKC', text)
-    
-    # Remove multiple spaces
-    text = re.sub(r'\s+', ' ', text)
+    if not text:
+        return ''
     
-    # Strip leading/trailing whitespace
-    text = text.strip()
+    # Short snippets (titles, sentences, fields) repeat often; cache those
+    if len(text) < _NORMALIZE_CACHE_MAX_LEN:
+        return _normalize_text_cached(text)
+    return _normalize_text(text)
+
+
+def _normalize_text(text: str) -> str:
+    """NFKC-normalize text and collapse its whitespace"""
+    # Normalize unicode (a no-op for pure ASCII, so skip the traversal)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
     
-    return text
+    # Collapse whitespace runs and strip both ends in one C-level pass
+    return ' '.join(text.split())
+
+
+_normalize_text_cached = functools.lru_cache(maxsize=4096)(_normalize_text)
 
 
 def compute_content_hash(content: str) -> str:
     """
-    Compute SHA256 hash of content for deduplication
+    Compute a 64-bit content hash for deduplication
+    
+    Uses BLAKE2b with an 8-byte digest, which is cheaper than truncating
+    SHA256; set CONTENT_HASH_ALGORITHM = 'sha256' to keep old hashes.
     
     Args:
         content: Text content
@@ -40,9 +73,50 @@ def compute_content_hash(content: str) -> str:
     Returns:
         Hex digest of hash
     """
+    if not content:
+        return _EMPTY_CONTENT_HASH
+    
     # Normalize before hashing
     normalized = normalize_text(content)
-    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+    if not normalized:
+        return _EMPTY_CONTENT_HASH
+    return _hash_normalized(normalized)
+
+
+def _hash_normalized(normalized: str) -> str:
+    """Hash already-normalized text with CONTENT_HASH_ALGORITHM"""
+    if CONTENT_HASH_ALGORITHM == 'sha256':
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+
+
+# Hash of empty/whitespace-only content, computed once
+_EMPTY_CONTENT_HASH = _hash_normalized('')
+
+
+def compute_file_content_hash(filepath: Path) -> str:
+    """
+    Compute a 64-bit hash of a file's raw bytes
+    
+    Unlike compute_content_hash the content is not decoded or normalized, so
+    only byte-identical files share a hash. The file is streamed into the
+    hash instead of being held in memory.
+    
+    Args:
+        filepath: File to hash
+        
+    Returns:
+        Hex digest of hash
+    """
+    with open(filepath, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=8))
+        else:
+            digest = hashlib.blake2b(digest_size=8)
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    
+    return digest.hexdigest()
 
 
 def clean_latex_command(text: str, command: str) -> str:
@@ -56,9 +130,8 @@ def clean_latex_command(text: str, command: str) -> str:
     Returns:
         Text with command removed
     """
-    # Escape backslash for regex
-    pattern = re.escape(command)
-    return re.sub(pattern, '', text)
+    # A fixed string needs no regex; str.replace is one C-level scan
+    return text.replace(command, '')
 
 
 def extract_cite_keys(text: str) -> List[str]:
@@ -71,16 +144,8 @@ def extract_cite_keys(text: str) -> List[str]:
     Returns:
         List of citation keys
     """
-    # Match \cite{key1,key2,key3} or \cite{key}
-    pattern = r'\\cite\*?\{([^}]+)\}'
-    matches = re.findall(pattern, text)
-    
-    keys = []
-    for match in matches:
-        # Split by comma for multiple citations
-        keys.extend([k.strip() for k in match.split(',')])
-    
-    return keys
+    # Match \cite{key1,key2,key3} or \cite{key}, then each key inside it
+    return [key for block in _CITE_RE.findall(text) for key in _CITE_KEY_RE.findall(block)]
 
 
 def generate_element_id(pub_id: str, version: str, element_type: str, index: int, 
@@ -99,9 +164,9 @@ def generate_element_id(pub_id: str, version: str, element_type: str, index: int
         Unique element ID
     """
     if parent_id:
-        return f"{parent_id}-{element_type}-{index}"
+        return '-'.join((parent_id, element_type, str(index)))
     else:
-        return f"{pub_id}-{version}-{element_type}-{index}"
+        return '-'.join((pub_id, version, element_type, str(index)))
 
 
 def is_math_environment(env_name: str) -> bool:
@@ -114,8 +179,7 @@ def is_math_environment(env_name: str) -> bool:
     Returns:
         True if math environment
     """
-    from config import MATH_BLOCK_ENVS
-    return env_name in MATH_BLOCK_ENVS
+    return env_name in _MATH_ENVS
 
 
 def is_figure_environment(env_name: str) -> bool:
@@ -128,8 +192,7 @@ def is_figure_environment(env_name: str) -> bool:
     Returns:
         True if figure/table environment
     """
-    from config import FIGURE_ENVS
-    return env_name in FIGURE_ENVS
+    return env_name in _FIGURE_ENVS
 
 
 def is_list_environment(env_name: str) -> bool:
@@ -142,8 +205,7 @@ def is_list_environment(env_name: str) -> bool:
     Returns:
         True if list environment
     """
-    from config import LIST_ENVS
-    return env_name in LIST_ENVS
+    return env_name in _LIST_ENVS
 
 
 def read_file_safe(filepath: Path) -> Optional[str]:
@@ -158,12 +220,20 @@ def read_file_safe(filepath: Path) -> Optional[str]:
     """
     encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
     
-    for encoding in encodings:
-        try:
-            with open(filepath, 'r', encoding=encoding) as f:
-                return f.read()
-        except (UnicodeDecodeError, FileNotFoundError):
-            continue
+    # Read once; fallback encodings only re-decode the bytes in memory
+    try:
+        data = Path(filepath).read_bytes()
+    except FileNotFoundError:
+        data = None
+    
+    if data is not None:
+        for encoding in encodings:
+            try:
+                text = data.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+            # Same newline translation as text-mode open()
+            return text.replace('\r\n', '\n').replace('\r', '\n')
     
     print(f"Warning: Could not read file {filepath}")
     return None
@@ -184,8 +254,13 @@ def write_json_safe(data: Any, filepath: Path) -> bool:
     
     try:
         filepath.parent.mkdir(parents=True, exist_ok=True)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            # Non-str keys are stringified like the stdlib json fallback does
+            options = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            filepath.write_bytes(orjson.dumps(data, option=options))
+        else:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
         return True
     except Exception as e:
         print(f"Error writing to {filepath}: {e}")
@@ -205,6 +280,8 @@ def load_json_safe(filepath: Path) -> Optional[Dict]:
     import json
     
     try:
+        if orjson is not None:
+            return orjson.loads(Path(filepath).read_bytes())
         with open(filepath, 'r', encoding='utf-8') as f:
             return json.load(f)
     except Exception as e: